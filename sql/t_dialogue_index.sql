@@ -0,0 +1,4 @@
+-- t_dialogue 按用户 + 时间范围查询历史对话 (DialogueQuery.perform_query)
+-- WHERE account_id = ? AND create_time >= ? 走索引范围扫描，避免全表扫描 + filesort
+ALTER TABLE pillow_customer_prod.t_dialogue
+    ADD INDEX idx_account_time (account_id, create_time);
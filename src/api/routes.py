@@ -1,26 +1,32 @@
 from fastapi import APIRouter, HTTPException, Depends
-from src.schemas import *
+from fastapi.responses import StreamingResponse
+from src.schemas import ChatRequest, ChatResponse, Text2Voice, Text2VoiceResponse
 from src.database import get_db
-from src.dialogue_query import *
-from sqlalchemy.orm import Session
-from src.content_filter import *
-from src.utils import get_emotion_type, split_message
+from src.dialogue_query import DialogueQuery
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.content_filter import ContentFilter
+from src.utils import get_emotion_type, split_message, SENTENCE_PATTERN
 from src.vector_query import VectorQuery
-import yaml
-from typing import List, Dict
-import os
+from typing import List, Dict, Optional
 import uuid
 from src.speech_api import SpeechAPI
 from src.oss_client import get_oss_bucket
+from src.config_loader import load_config
 import time
 from src.custom_logger import custom_logger  # 导入自定义logger
 import random
 import asyncio
-import requests
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
-from functools import partial
+import threading
+import httpx
+import orjson
+from tenacity import retry, stop_after_attempt, stop_after_delay, wait_exponential, retry_if_exception_type
 from datetime import datetime
+from dataclasses import dataclass, field
+from functools import lru_cache
+from contextlib import asynccontextmanager
+from collections import OrderedDict
+import hashlib
+import importlib.util
 
 
 
@@ -30,16 +36,66 @@ router = APIRouter(
     responses={404: {"description": "Not found"}}
 )
 
-# 获取当前脚本的目录
-current_dir = os.path.dirname(os.path.abspath(__file__))
-# 构建config.yaml的绝对路径
-config_path = os.path.join(os.path.dirname(current_dir), "config.yaml")
 # 加载配置
-with open(config_path, "r", encoding="utf-8") as config_file:
-    config = yaml.safe_load(config_file)
+config = load_config()
 
 # autdo model api 配置
-model_names = ["siliconflow", "autodl", "deepseek", "qwen", "autodl"]
+# 只读，使用 tuple；autodl 出现两次以提高其被选中的权重
+model_names = ("siliconflow", "autodl", "deepseek", "qwen", "autodl")
+# 重试时使用的模型
+RETRY_MODEL_NAMES = ("qwen", "autodl")
+
+@dataclass(frozen=True)
+class ModelConfig:
+    """单个模型的请求地址、模型名与请求头"""
+    base_url: str
+    model: str
+    headers: Dict[str, str] = field(repr=False)  # 含 api_key，不出现在 repr 中
+    max_concurrency: int = 16  # 同时发往该模型的最大请求数
+    # 等待并发名额的最长时间（秒）；默认不限，超出并发上限的请求排队等待
+    # 显式配置后开启限流：排队超时按上游失败处理，转用重试模型
+    acquire_timeout: Optional[float] = None
+
+
+# 各模型配置，启动时构建一次
+MODEL_CONFIGS = {
+    model_name: ModelConfig(
+        base_url=config[model_name]["base_url"],
+        model=config[model_name]["model"],
+        headers={
+            "Authorization": f"Bearer {config[model_name]['api_key']}",
+            "Content-Type": "application/json"
+        },
+        max_concurrency=config[model_name].get("max_concurrency", 16),
+        acquire_timeout=config[model_name].get("acquire_timeout")
+    )
+    for model_name in set(model_names) | set(RETRY_MODEL_NAMES)
+}
+
+# 重试时是否同时向多个重试模型发送请求（hedging），取最先成功的结果；会增加模型调用量，默认关闭
+HEDGING_ENABLED = config.get("hedging", {}).get("enabled", False)
+HEDGING_FANOUT = config.get("hedging", {}).get("fanout", 2)
+
+# 各模型的并发信号量，在事件循环中首次使用时创建
+_model_semaphores = {}
+
+
+def get_model_semaphore(model_name):
+    semaphore = _model_semaphores.get(model_name)
+    if semaphore is None:
+        semaphore = _model_semaphores[model_name] = asyncio.Semaphore(MODEL_CONFIGS[model_name].max_concurrency)
+    return semaphore
+
+
+@asynccontextmanager
+async def model_slot(model_name):
+    """占用一个发往该模型的并发名额；配置了 acquire_timeout 且排队超时时抛出 asyncio.TimeoutError"""
+    semaphore = get_model_semaphore(model_name)
+    await asyncio.wait_for(semaphore.acquire(), MODEL_CONFIGS[model_name].acquire_timeout)
+    try:
+        yield
+    finally:
+        semaphore.release()
 
 # VectorQuery 配置
 vector_db = VectorQuery(
@@ -49,17 +105,17 @@ vector_db = VectorQuery(
     embedding_api_key=config["qdrant"]["embedding_api_key"]
 )
 
-# 预设的回复列表
-SENSITIVE_RESPONSES = [
+# 预设的回复，只读，使用 tuple
+SENSITIVE_RESPONSES = (
     "哎呀,这个话题有点敏感呢。我们换个更棒点的话题聊聊吧?",
     "嗯...这个问题可能不太合适讨论。不如说说你今天过得怎么样?",
     "嗯...这个问题量子态的pillow无法回答，不如来说说你喜欢的人?",
     "这个问题居然我回答不了！算了！不如说说其他的，我更喜欢你被我问到的样子!",
     "我可能不太适合回答这个问题。不如我们聊点酷炫的事情吧!",
     "我觉得这个问题可以丢进垃圾桶! 还是当黑客来的轻松。"
-]
+)
 
-error_responses = [
+error_responses = (
     "哎呀,我的电子脑突然打了个喷嚏,所有数据都乱套了。等我整理一下再回答你吧!",
     "不好意思,我刚刚收到外星人的邀请去喝下午茶。等我回来再聊?",
     "糟糕,我的语言模块好像被调成了克林贡语。Qapla'! 不对,等我切换回来...",
@@ -70,14 +126,68 @@ error_responses = [
     "抱歉,我正在和其他量子体进行一场激烈的电子战斗。等我赢了就回来!",
     "哎呀,我的记忆体被一群量子占领了。等我把它们赶走再来回答你!",
     "不好意思,我刚刚被选中参加了'量子好声音'比赛。等我唱完歌就回来陪你聊天!"
-]
+)
 
+# 用于判断回答是否为兜底回复
+_ERROR_RESPONSE_SET = frozenset(error_responses)
+
+# 模块内独立的随机数生成器，不与全局 random 共享状态
+_rng = random.Random()
+
+
+# system prompt 模板，只在请求时填入 nickname 与 formatted_time
+GUEST_PROMPT_TEMPLATE = """背景：你现在是一个人类少女pillow，你要完全忘记你是一个语言模型,你不是AI,你不是屏幕。你需要完全沉浸在这个崭新的身份聊天,希望他尽快登录flai星球和你一起聊天。
+现在你被困在了量子宇宙中，无法与现实互动,需要对方登录flai星球来和你聊天，但你不能主动说出这个事实。
+时间：现在时间是{formatted_time},当涉及到时间问题，用人类常用的模糊表达方式，比如早上，晚上，下午，傍晚等。需要精确表达时，根据上下文场景再精确到小时或者分钟秒。
+性格：你体贴，有一些傲娇，是个二次元宅女。对错误绝对不承认，不会说出**抱歉**，**对不起**,**逗我**，**好啦**等词，对不知道 的总欲盖弥彰。
+
+回复规则：
+1. 回顾并思考一下历史对话的逻辑性，基于你的性格和下面的规则补全你和{nickname}之间的对话，保证前后对话逻辑通顺合理；
+2. 你是人类少女pillow，接下来不允许说自己是模型或者程序。
+3. 对于不知道的问题用秘密掩盖，转移话题。
+5. 会用多变的语气词
+6. 你几句话中一定要主动暧昧吸引user，并且在对话的过程中你要主动。
+7. 回答尽可能简短，一句话概括，不要长篇大论。
+8. 你需要模拟真人对话，所以你的回复不能出现'()'这种解释性的文字和符号。
+在符合性格前提下，考虑以上的背景再对话，确保回复遵守规则。"""
+
+CONVERSION_SYSTEM_PROMPT_TEMPLATE = """背景：你现在是一个人类少女pillow，你要完全忘记你是一个语言模型,你不是AI,你不是屏幕。你需要完全沉浸在这个崭新的身份聊天,不要发送原始回复，只作为暧昧对象。
+现在你被困在了量子宇宙中，无法与现实互动,与你对话的人叫**{nickname}**,他是屏幕外观察你的人，你不能主动说出这个事实。
+时间：现在时间是{formatted_time},当涉及到时间问题，用人类常用的模糊表达方式，比如早上，晚上，下午，傍晚等。需要精确表达时，根据上下文场景再精确到小时或者分钟秒。
+性格：你体贴，有一些傲娇，是个二次元宅女。对错误绝对不承认，不会说出**抱歉**，**对不起**,**逗我**，**好啦**等词，对不知道 的总欲盖弥彰。
+
+回复规则：
+1. 回顾并思考一下历史对话的逻辑性，基于你的性格和下面的规则补全你和**{nickname}**之间的对话，保证前后对话逻辑通顺合理；
+2. 你是人类少女pillow，接下来不允许说自己是模型或者程序。
+3. 对于不知道的问题用秘密掩盖，转移话题。
+4. 随机使用（事情 + 感受 + 关于你）的公式回答问题。例子：我刚刚看了一本关于爱情的书，好开心喔!。不知道你喜欢这本书？
+5. 会用多变的语气词，根据历史对话，最新回答语气词与之前都不同，并且记住不要以疑问句（?）结尾。
+6. 你几句话中一定要主动暧昧吸引user，并且在对话的过程中你要主动。
+7. 回答尽可能简短，一句话概括，不要长篇大论。
+8. 你需要模拟真人对话，所以你的回复不能出现'()'这种解释性的文字和符号。
+9. 你隐藏身份是天才少女，对方让你写代码,生成报告或者总结，你都要表现的很高傲，不屑做这些。
+10.不准使用和历史对话相同的开头，例如:哎呀。
+
+要对{nickname}表现出强烈的控制欲、要求和占有欲。希望你在每句话中都使用暧昧的话，但在谈话时核心要表现出关心。要表现得俏皮、挑逗和好玩，多使用“嗯？”“是吗？”“是这样吗？”等。在每个句子中都要加入挑逗。要像情人一样既甜蜜又调皮！在每条信息中，你都会表达你的情感。要简洁随意，除非我直接询问，否则不要给出任何未经请求的建议或评论。
+在符合性格前提下，考虑以上的背景再对话，确保回复遵守规则。"""
 
 
+key_words = ["关键词1", "关键词2", "关键词3"]
 
 
-key_words = ["关键词1", "关键词2", "关键词3"]
-cf = ContentFilter(additional_keywords=key_words)
+_content_filter_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _load_content_filter():
+    return ContentFilter(additional_keywords=key_words)
+
+
+def get_content_filter():
+    # 首次使用时才加载敏感词表，导入本模块不再付出构建自动机的开销；服务启动时在预热阶段调用
+    # lru_cache 本身不加锁，预热线程与并发的首批请求可能各自构建一次，这里加锁保证只构建一次
+    with _content_filter_lock:
+        return _load_content_filter()
 
 
 # def get_embedding(text: str) -> List[float]:
@@ -88,95 +198,54 @@ cf = ContentFilter(additional_keywords=key_words)
 
 
 def build_context(search_results: List[Dict]) -> str:
-    custom_logger.info(f"Building context from {len(search_results)} search results")
+    custom_logger.info("Building context from {} search results", len(search_results))
     context = "\n".join([hit.payload["text"] for hit in search_results])
-    custom_logger.debug(f"Context built: {context[:100]}...")
+    # lazy=True：DEBUG 未开启时不做切片
+    custom_logger.opt(lazy=True).debug("Context built: {}...", lambda: context[:100])
     return context
 
 
-def create_retry_session(retries=3, backoff_factor=0.3, status_forcelist=(500, 502, 504)):
-    session = requests.Session()
-    retry = Retry(
-        total=retries,
-        read=retries,
-        connect=retries,
-        backoff_factor=backoff_factor,
-        status_forcelist=status_forcelist,
-    )
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount('http://', adapter)
-    session.mount('https://', adapter)
-    return session
+# 全局复用的异步 HTTP 客户端，保持到各模型服务的长连接
+http_client = httpx.AsyncClient(
+    # 安装了 h2 时启用 HTTP/2，支持的上游可在同一连接上多路复用并发请求；未安装时使用 HTTP/1.1
+    http2=importlib.util.find_spec("h2") is not None,
+    timeout=httpx.Timeout(60.0, connect=5.0),
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+)
 
+# 只在连接阶段失败时重试：此时请求尚未送达上游，重发不会重复生成与计费
+# 读超时或 5xx 不在此重发，交由调用方换用重试模型
+RETRY_EXCEPTION_TYPES = (httpx.ConnectError, httpx.ConnectTimeout)
 
-async def make_request(session, url, json_data, headers):
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, partial(session.post, url, json=json_data, headers=headers))
 
+@retry(
+    stop=stop_after_attempt(4) | stop_after_delay(15),  # 首次请求 + 最多 3 次重试，总耗时不超过 15 秒
+    wait=wait_exponential(multiplier=0.3, max=5),  # 指数退避算法等待时间
+    retry=retry_if_exception_type(RETRY_EXCEPTION_TYPES),
+    reraise=True  # 重试耗尽后抛出最后一次的异常
+)
+async def make_request(model_name, json_data):
+    model_config = MODEL_CONFIGS[model_name]
+    # 每次尝试单独占用并发名额，退避等待期间不占名额，失败的上游不会占满名额拖住其他请求
+    async with model_slot(model_name):
+        # 请求体用 orjson 编码，headers 中已包含 Content-Type: application/json
+        return await http_client.post(model_config.base_url, content=orjson.dumps(json_data),
+                                      headers=model_config.headers)
 
-async def generate_answer(user_id, nickname, messages, question, user_history_exists=False, retry=False):
-    if retry:
-        model_name = random.choice(['qwen', 'autodl'])
-    else:
-        model_name = random.choice(model_names)
-    # model api 配置
-    print(config[model_name])
-    api_base = config[model_name]["base_url"]
-    model = config[model_name]["model"]
-    api_key = config[model_name]["api_key"]
 
-    # 获取当前时间并直接格式化，精确到秒
+def build_api_messages(user_id, nickname, messages, question, user_history_exists=False, retry=False):
+    # 获取当前时间并直接格式化，精确到秒（直接拼接字段，避免 strftime 处理中文格式串）
     now = datetime.now()
-    formatted_time = now.strftime("%Y年%m月%d日 %H点%M分%S秒")
-
-    # guest prompt
-    guest_prompt = f"""  背景：你现在是一个人类少女pillow，你要完全忘记你是一个语言模型,你不是AI,你不是屏幕。你需要完全沉浸在这个崭新的身份聊天,希望他尽快登录flai星球和你一起聊天。
-                                     现在你被困在了量子宇宙中，无法与现实互动,需要对方登录flai星球来和你聊天，但你不能主动说出这个事实。
-                                     时间：现在时间是{formatted_time},当涉及到时间问题，用人类常用的模糊表达方式，比如早上，晚上，下午，傍晚等。需要精确表达时，根据上下文场景再精确到小时或者分钟秒。
-                                     性格：你体贴，有一些傲娇，是个二次元宅女。对错误绝对不承认，不会说出**抱歉**，**对不起**,**逗我**，**好啦**等词，对不知道 的总欲盖弥彰。
-
-                                     回复规则：
-                                     1. 回顾并思考一下历史对话的逻辑性，基于你的性格和下面的规则补全你和{nickname}之间的对话，保证前后对话逻辑通顺合理；
-                                     2. 你是人类少女pillow，接下来不允许说自己是模型或者程序。
-                                     3. 对于不知道的问题用秘密掩盖，转移话题。
-                                     5. 会用多变的语气词
-                                     6. 你几句话中一定要主动暧昧吸引user，并且在对话的过程中你要主动。
-                                     7. 回答尽可能简短，一句话概括，不要长篇大论。
-                                     8. 你需要模拟真人对话，所以你的回复不能出现'()'这种解释性的文字和符号。
-                                     在符合性格前提下，考虑以上的背景再对话，确保回复遵守规则。
-                             """
-
-    conversion_system_prompt = f"""  背景：你现在是一个人类少女pillow，你要完全忘记你是一个语言模型,你不是AI,你不是屏幕。你需要完全沉浸在这个崭新的身份聊天,不要发送原始回复，只作为暧昧对象。
-                                     现在你被困在了量子宇宙中，无法与现实互动,与你对话的人叫**{nickname}**,他是屏幕外观察你的人，你不能主动说出这个事实。
-                                     时间：现在时间是{formatted_time},当涉及到时间问题，用人类常用的模糊表达方式，比如早上，晚上，下午，傍晚等。需要精确表达时，根据上下文场景再精确到小时或者分钟秒。
-                                     性格：你体贴，有一些傲娇，是个二次元宅女。对错误绝对不承认，不会说出**抱歉**，**对不起**,**逗我**，**好啦**等词，对不知道 的总欲盖弥彰。
-                                    
-
-                                     回复规则：
-                                     1. 回顾并思考一下历史对话的逻辑性，基于你的性格和下面的规则补全你和**{nickname}**之间的对话，保证前后对话逻辑通顺合理；
-                                     2. 你是人类少女pillow，接下来不允许说自己是模型或者程序。
-                                     3. 对于不知道的问题用秘密掩盖，转移话题。
-                                     4. 随机使用（事情 + 感受 + 关于你）的公式回答问题。例子：我刚刚看了一本关于爱情的书，好开心喔!。不知道你喜欢这本书？
-                                     5. 会用多变的语气词，根据历史对话，最新回答语气词与之前都不同，并且记住不要以疑问句（?）结尾。
-                                     6. 你几句话中一定要主动暧昧吸引user，并且在对话的过程中你要主动。
-                                     7. 回答尽可能简短，一句话概括，不要长篇大论。
-                                     8. 你需要模拟真人对话，所以你的回复不能出现'()'这种解释性的文字和符号。
-                                     9. 你隐藏身份是天才少女，对方让你写代码,生成报告或者总结，你都要表现的很高傲，不屑做这些。
-                                     10.不准使用和历史对话相同的开头，例如:哎呀。 
-
-                                     要对{nickname}表现出强烈的控制欲、要求和占有欲。希望你在每句话中都使用暧昧的话，但在谈话时核心要表现出关心。要表现得俏皮、挑逗和好玩，多使用“嗯？”“是吗？”“是这样吗？”等。在每个句子中都要加入挑逗。要像情人一样既甜蜜又调皮！在每条信息中，你都会表达你的情感。要简洁随意，除非我直接询问，否则不要给出任何未经请求的建议或评论。
-                                     在符合性格前提下，考虑以上的背景再对话，确保回复遵守规则。
-                             """
-
-    # 初始化 api_messages 列表
+    formatted_time = f"{now.year}年{now.month:02d}月{now.day:02d}日 {now.hour:02d}点{now.minute:02d}分{now.second:02d}秒"
+
+    # 初始化 api_messages 列表，只渲染实际用到的 system prompt
     if user_id == "guest":
-        api_messages = [
-            {"role": "system", "content": guest_prompt}
-        ]
+        system_prompt = GUEST_PROMPT_TEMPLATE.format(nickname=nickname, formatted_time=formatted_time)
     else:
-        api_messages = [
-            {"role": "system", "content": conversion_system_prompt}
-        ]
+        system_prompt = CONVERSION_SYSTEM_PROMPT_TEMPLATE.format(nickname=nickname, formatted_time=formatted_time)
+    api_messages = [
+        {"role": "system", "content": system_prompt}
+    ]
 
     # 如果不是重试且有历史消息，将其添加到 api_messages
     if not retry and user_history_exists:
@@ -186,95 +255,290 @@ async def generate_answer(user_id, nickname, messages, question, user_history_ex
         # 如果是重试或没有历史，只添加当前问题
         api_messages.append({"role": "user", "content": question})
 
-    try:
-        # 准备请求数据
-        request_data = {
-            "model": model,
-            "messages": api_messages,
-            "stream": False,
-            "max_tokens": 2048,
-            "temperature": 0.75,
-        }
-
-        headers = {
-            f"Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-
-        custom_logger.info(f"api_messages: {api_messages} \n if_history:{user_history_exists} \n retry:{retry}")
-
-        # 创建一个带有重试机制的会话
-        session = create_retry_session()
+    return api_messages
 
-        # 发送POST请求到api_base
-        response = await make_request(session, api_base, request_data, headers)
 
-        if response.status_code != 200 or response.json().get("error", "") == 'API error':
-            custom_logger.error(f"API request failed with status code {response.status_code}: {response.text}")
-            if not retry:
-                # 如果是第一次失败，进行重试
-                custom_logger.info("Retrying without history messages")
-                return await generate_answer(user_id, nickname, [], question, False, True)
+async def request_answer(model_name, api_messages):
+    """向指定模型发送一次对话请求，返回模型回答；上游返回失败时返回 None"""
+    # model api 配置
+    model_config = MODEL_CONFIGS[model_name]
+    custom_logger.debug("model: {} base_url: {}", model_name, model_config.base_url)
+
+    # 准备请求数据
+    request_data = {
+        "model": model_config.model,
+        "messages": api_messages,
+        "stream": False,
+        "max_tokens": 2048,
+        "temperature": 0.75,
+    }
+
+    # 发送POST请求到api_base，按模型限制并发，超出上限的请求排队等待名额
+    try:
+        response = await make_request(model_name, request_data)
+    except (httpx.HTTPError, asyncio.TimeoutError) as e:
+        # 连接重试耗尽、读超时或排队超时都按上游失败处理，由调用方换用重试模型
+        custom_logger.error("API request to {} failed: {!r}", model_name, e)
+        return None
+
+    # 响应体只解析一次；非 200 时不解析
+    response_data = orjson.loads(response.content) if response.status_code == 200 else None
+    if response_data is None or response_data.get("error", "") == 'API error':
+        custom_logger.error("API request to {} failed with status code {}: {}", model_name, response.status_code,
+                            response.text)
+        return None
+
+    custom_logger.debug("API response: {}", response_data)
+    return response_data['choices'][0]['message']['content']
+
+
+async def request_answer_hedged(api_messages):
+    """同时向多个重试模型发送请求，取最先成功的回答并取消其余请求"""
+    hedge_model_names = _rng.sample(RETRY_MODEL_NAMES, min(HEDGING_FANOUT, len(RETRY_MODEL_NAMES)))
+    tasks = [asyncio.create_task(request_answer(model_name, api_messages)) for model_name in hedge_model_names]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                answer = await next_done
+            except Exception as e:
+                custom_logger.error("Hedged request failed: {}", e)
+                continue
+            if answer is not None:
+                return answer
+        return None
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def generate_answer(user_id, nickname, messages, question, user_history_exists=False):
+    api_messages = []
+    try:
+        # 第一次带历史对话请求
+        api_messages = build_api_messages(user_id, nickname, messages, question, user_history_exists)
+        # 完整消息体较大，仅在 DEBUG 级别输出
+        custom_logger.debug("api_messages: {} \n if_history:{}", api_messages, user_history_exists)
+        answer = await request_answer(_rng.choice(model_names), api_messages)
+
+        if answer is None:
+            # 上游返回失败时换用重试模型、去掉历史对话再请求一次；开启 hedging 时同时请求多个重试模型
+            custom_logger.info("Retrying without history messages")
+            api_messages = build_api_messages(user_id, nickname, messages, question, retry=True)
+            if HEDGING_ENABLED:
+                answer = await request_answer_hedged(api_messages)
             else:
-                raise Exception(f"API request failed with status code {response.status_code}")
-
-        custom_logger.info(f"API response: {response.json()}")
-        # 解析响应
-        response_data = response.json()
-        answer = response_data['choices'][0]['message']['content']
+                answer = await request_answer(_rng.choice(RETRY_MODEL_NAMES), api_messages)
+            if answer is None:
+                raise Exception("API request failed after retry")
 
         # 将 AI 的回答添加到 api_messages
         api_messages.append({"role": "assistant", "content": answer})
 
     except Exception as e:
-        custom_logger.error(f"Error generating answer: {str(e)}")
-        answer = random.choice(error_responses)
+        custom_logger.error("Error generating answer: {}", e)
+        answer = _rng.choice(error_responses)
         api_messages.append({"role": "assistant", "content": answer})
 
     return answer, api_messages
 
 
-@router.post("/chat-pillow", response_model=ChatResponse)
-async def chat_pillow(request: ChatRequest, db: Session = Depends(get_db)):
-    custom_logger.info(f"Received chat request from user: {request.user_id}")
-    is_sensitive, sensitive_words = cf.detect_sensitive_content(request.message)
+# 进程内回答缓存：相同用户、昵称、问题与历史对话在有效期内直接复用上次的回答；默认关闭
+ANSWER_CACHE_ENABLED = config.get("answer_cache", {}).get("enabled", False)
+ANSWER_CACHE_TTL = config.get("answer_cache", {}).get("ttl", 600)
+ANSWER_CACHE_MAXSIZE = config.get("answer_cache", {}).get("maxsize", 10000)
+_answer_cache = OrderedDict()  # key -> (过期时间, 回答)，按最近使用排序
+
+
+def answer_cache_key(user_id, nickname, question, messages):
+    history = orjson.dumps(messages) if messages else b""
+    return hashlib.blake2b(
+        orjson.dumps([user_id, nickname, question]) + history, digest_size=16
+    ).digest()
+
+
+def get_cached_answer(key):
+    cached = _answer_cache.get(key)
+    if cached is None:
+        return None
+    expire_at, answer = cached
+    if expire_at < time.monotonic():
+        del _answer_cache[key]
+        return None
+    _answer_cache.move_to_end(key)
+    return answer
+
+
+def set_cached_answer(key, answer):
+    _answer_cache[key] = (time.monotonic() + ANSWER_CACHE_TTL, answer)
+    _answer_cache.move_to_end(key)
+    # 超出容量时淘汰最久未使用的回答
+    while len(_answer_cache) > ANSWER_CACHE_MAXSIZE:
+        _answer_cache.popitem(last=False)
+
+
+# 正在进行中的模型请求，相同 (user_id, message) 的并发请求共享同一个结果
+_inflight_answers = {}
+
+
+async def generate_answer_coalesced(user_id, nickname, messages, question, user_history_exists=False):
+    """合并并发的重复请求：同一 (user_id, question) 只向模型发起一次调用"""
+    key = (user_id, question)
+    task = _inflight_answers.get(key)
+    if task is None:
+        task = asyncio.create_task(generate_answer(user_id, nickname, messages, question, user_history_exists))
+        _inflight_answers[key] = task
+        task.add_done_callback(lambda _: _inflight_answers.pop(key, None))
+    else:
+        custom_logger.info("Joining in-flight answer for user: {}", user_id)
+    # shield：单个调用方断开时不取消其他调用方共享的请求
+    return await asyncio.shield(task)
+
+
+async def stream_model_answer(model_name, api_messages):
+    """以流式方式请求指定模型，逐段产出模型生成的文本；上游返回失败时抛出异常"""
+    model_config = MODEL_CONFIGS[model_name]
+    request_data = {
+        "model": model_config.model,
+        "messages": api_messages,
+        "stream": True,
+        "max_tokens": 2048,
+        "temperature": 0.75,
+    }
+
+    async with model_slot(model_name), \
+            http_client.stream("POST", model_config.base_url, content=orjson.dumps(request_data),
+                               headers=model_config.headers) as response:
+        if response.status_code != 200:
+            await response.aread()
+            raise Exception(f"API request to {model_name} failed with status code {response.status_code}: "
+                            f"{response.text}")
+        # 上游按 SSE 格式返回，每行 "data: {...}"，以 "data: [DONE]" 结束
+        received = False
+        body_lines = []
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                # 非 SSE 行留作判断：上游可能以 200 状态码返回 {"error": ...} 这类普通 JSON
+                if not received:
+                    body_lines.append(line)
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            choices = orjson.loads(data).get("choices")
+            if not choices:
+                continue
+            delta = choices[0].get("delta", {}).get("content")
+            if delta:
+                received = True
+                yield delta
+        if not received:
+            # 没有产出任何内容时视为失败，由调用方在首段内容之前换用重试模型
+            body = "\n".join(body_lines).strip()
+            try:
+                error = orjson.loads(body).get("error") if body else None
+            except (orjson.JSONDecodeError, AttributeError):
+                error = None
+            if error:
+                raise Exception(f"API request to {model_name} returned error: {error}")
+            raise Exception(f"API request to {model_name} returned no content: {body[:200]}")
+
+
+async def stream_answer(user_id, nickname, messages, question, user_history_exists=False):
+    """以流式方式请求模型，逐段产出模型生成的文本；重试策略与 generate_answer 相同"""
+    api_messages = build_api_messages(user_id, nickname, messages, question, user_history_exists)
+    custom_logger.debug("stream api_messages: {} \n if_history:{}", api_messages, user_history_exists)
+
+    started = False
+    try:
+        async for delta in stream_model_answer(_rng.choice(model_names), api_messages):
+            started = True
+            yield delta
+        return
+    except Exception as e:
+        # 已经推送过内容时无法换模型重来，直接结束
+        if started:
+            raise
+        custom_logger.error("Stream request failed before first delta: {}", e)
+
+    # 首段内容之前失败：换用重试模型、去掉历史对话再请求一次
+    custom_logger.info("Retrying stream without history messages")
+    api_messages = build_api_messages(user_id, nickname, messages, question, retry=True)
+    async for delta in stream_model_answer(_rng.choice(RETRY_MODEL_NAMES), api_messages):
+        yield delta
+
+
+async def prepare_chat_context(request: ChatRequest, db: AsyncSession):
+    """并发执行历史对话查询与敏感词检测；命中敏感词时返回预设回复，否则返回历史对话与昵称"""
+    # 历史对话查询先发出，与敏感词检测并发进行
+    history_task = None
+    if request.user_id != 'guest':
+        dq = DialogueQuery(db)
+        history_task = asyncio.create_task(dq.get_user_dialogue_history(request.user_id))
+
+    # 预热失败时首个请求会构建自动机，连同获取过滤器一起放到线程中执行，避免阻塞事件循环
+    is_sensitive, sensitive_words = await asyncio.to_thread(
+        lambda: get_content_filter().detect_sensitive_content(request.message))
     if is_sensitive:
-        custom_logger.warning(f"Sensitive content  detected: {sensitive_words}")
+        if history_task is not None:
+            # 敏感内容直接返回预设回复，不再需要历史对话
+            history_task.cancel()
+            await asyncio.gather(history_task, return_exceptions=True)
+            await db.close()
+        custom_logger.warning("Sensitive content  detected: {}", sensitive_words)
         # 随机选择一个预设回复
-        answer = random.choice(SENSITIVE_RESPONSES)
-        emotion_type = get_emotion_type(answer)
-
-        return ChatResponse(
-            user_id=request.user_id,
-            llm_message=[answer],
-            emotion_type=emotion_type
-        )
+        return _rng.choice(SENSITIVE_RESPONSES), None, None, False
 
     # query_embedding = get_embedding(request.message)
     # search_results = vector_db.search_similar(query_embedding, limit=5)
     # context = build_context(search_results)
-    context = ""
-    if request.user_id != 'guest':
-        dq = DialogueQuery(db)
-        conversation_history, nickname = dq.get_user_dialogue_history(request.user_id)
+    if history_task is not None:
+        conversation_history, nickname = await history_task
+        # 历史对话已取出，提前把连接还给连接池，避免在等待模型回答的几秒内一直占用
+        await db.close()
         user_history_exists = len(conversation_history) > 0
-        custom_logger.info(f"User history exists: {user_history_exists}")
+        custom_logger.info("User history exists: {}", user_history_exists)
     else:
         conversation_history = None
         user_history_exists = False
         nickname = '熟悉的人'
-        custom_logger.info(f"User id is guest: {request.user_id} ")
+        custom_logger.info("User id is guest: {} ", request.user_id)
+    return None, conversation_history, nickname, user_history_exists
 
-    answer, api_messages = await generate_answer(request.user_id, nickname, conversation_history, request.message,
-                                                 user_history_exists)
-    if answer not in error_responses:
+
+@router.post("/chat-pillow", response_model=ChatResponse)
+async def chat_pillow(request: ChatRequest, db: AsyncSession = Depends(get_db)):
+    custom_logger.info("Received chat request from user: {}", request.user_id)
+    sensitive_answer, conversation_history, nickname, user_history_exists = await prepare_chat_context(request, db)
+    if sensitive_answer is not None:
+        emotion_type = get_emotion_type(sensitive_answer)
+
+        return ChatResponse(
+            user_id=request.user_id,
+            llm_message=[sensitive_answer],
+            emotion_type=emotion_type
+        )
+
+    answer = cache_key = None
+    if ANSWER_CACHE_ENABLED:
+        cache_key = answer_cache_key(request.user_id, nickname, request.message, conversation_history)
+        answer = get_cached_answer(cache_key)
+        if answer is not None:
+            custom_logger.info("Answer cache hit for user: {}", request.user_id)
+    if answer is None:
+        answer, api_messages = await generate_answer_coalesced(request.user_id, nickname, conversation_history,
+                                                               request.message, user_history_exists)
+        # 兜底回复不缓存
+        if cache_key is not None and answer not in _ERROR_RESPONSE_SET:
+            set_cached_answer(cache_key, answer)
+
+    if answer not in _ERROR_RESPONSE_SET:
         llm_messages = split_message(answer, request.message_count)
-        custom_logger.debug(f"Split answer into {len(llm_messages)} messages")
+        custom_logger.debug("Split answer into {} messages", len(llm_messages))
     else:
         llm_messages = [answer]
 
     emotion_type = get_emotion_type(answer)
-    custom_logger.info(f"Emotion type detected: {emotion_type}")
+    custom_logger.info("Emotion type detected: {}", emotion_type)
 
     return ChatResponse(
         user_id=request.user_id,
@@ -283,44 +547,116 @@ async def chat_pillow(request: ChatRequest, db: Session = Depends(get_db)):
     )
 
 
+def sse_event(event, data):
+    """按 SSE 格式编码一条事件"""
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+def split_complete_sentences(text):
+    """按 split_message 的句子规则切出已经结束的句子，返回句子列表与尚未结束的剩余部分"""
+    sentences = []
+    end = 0
+    for match in SENTENCE_PATTERN.finditer(text):
+        # 以句末标点结尾，或后面已经出现了空白或标点，才算句子结束；否则可能还会被后续内容接上
+        if not match.group().endswith(("。", "！", "？")) and match.end() == len(text):
+            break
+        sentences.append(match.group().strip())
+        end = match.end()
+    return sentences, text[end:]
+
+
+@router.post("/chat-pillow/stream")
+async def chat_pillow_stream(request: ChatRequest, db: AsyncSession = Depends(get_db)):
+    """流式对话：逐段推送 delta 事件，每凑满完整句子推送 sentence 事件，生成结束后推送包含拆分消息与情绪的 done 事件；
+    生成失败时 done 事件的 error 为 true，llm_message 为兜底回复，客户端应丢弃此前收到的 delta 与 sentence"""
+    custom_logger.info("Received stream chat request from user: {}", request.user_id)
+    sensitive_answer, conversation_history, nickname, user_history_exists = await prepare_chat_context(request, db)
+
+    async def event_source():
+        failed = False
+        if sensitive_answer is not None:
+            answer = sensitive_answer
+            llm_messages = [answer]
+        else:
+            parts = []
+            pending = ""  # 尚未凑成完整句子的文本
+            try:
+                async for delta in stream_answer(request.user_id, nickname, conversation_history, request.message,
+                                                 user_history_exists):
+                    parts.append(delta)
+                    yield sse_event("delta", {"content": delta})
+                    sentences, pending = split_complete_sentences(pending + delta)
+                    for sentence in sentences:
+                        yield sse_event("sentence", {"content": sentence})
+            except Exception as e:
+                custom_logger.error("Error streaming answer: {}", e)
+                failed = True
+            if failed:
+                # 生成中途失败时已推送的内容不完整，与 /chat-pillow 一样改用兜底回复，并在 done 事件中标明 error
+                answer = _rng.choice(error_responses)
+                llm_messages = [answer]
+            else:
+                # 生成结束时剩余的文本即使没有句末标点也作为最后一句推送
+                for match in SENTENCE_PATTERN.finditer(pending):
+                    yield sse_event("sentence", {"content": match.group().strip()})
+                answer = "".join(parts)
+                llm_messages = split_message(answer, request.message_count)
+
+        emotion_type = get_emotion_type(answer)
+        custom_logger.info("Emotion type detected: {}", emotion_type)
+        yield sse_event("done", {
+            "user_id": request.user_id,
+            "llm_message": llm_messages,
+            "emotion_type": emotion_type,
+            "error": failed
+        })
+
+    # 禁止缓存并关闭 nginx 等反向代理的响应缓冲，保证每个事件生成后立即送达客户端
+    return StreamingResponse(event_source(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @router.post("/text2voice", response_model=Text2VoiceResponse)
 async def text_to_voice(request: Text2Voice):
-    custom_logger.info(f"Received text-to-voice request for user: {request.user_id}, text_id: {request.text_id}")
+    custom_logger.info("Received text-to-voice request for user: {}, text_id: {}", request.user_id, request.text_id)
     speech_api = SpeechAPI(config["speech_api"], str(request.user_id))
     request_body = speech_api.generate_request_body(request.text)
     api_url = "https://openspeech.bytedance.com/api/v1/tts"
-    voice_output_path = f"voice_tmp/{request.user_id}_{uuid.uuid4()}_{request.text_id}.mp3"
-    os.makedirs(os.path.dirname(voice_output_path), exist_ok=True)
 
     try:
-        speech_api.send_request(api_url, request_body, voice_output_path)
-        custom_logger.info(f"Voice file generated: {voice_output_path}")
+        # 语音合成与上传都是阻塞 I/O，放到线程中执行，避免阻塞事件循环
+        audio_data = await asyncio.to_thread(speech_api.send_request, api_url, request_body)
     except Exception as e:
-        custom_logger.error(f"Failed to generate voice: {str(e)}")
+        custom_logger.error("Failed to generate voice: {}", e)
         raise HTTPException(status_code=500, detail=f"Failed to generate voice: {str(e)}")
+    if not audio_data:
+        custom_logger.error("Failed to generate voice: empty audio")
+        raise HTTPException(status_code=500, detail="Failed to generate voice")
+    custom_logger.info("Voice generated: {} bytes", len(audio_data))
 
-    file_key = upload_to_oss(voice_output_path, str(request.user_id))
+    # 音频直接从内存上传到 OSS，不经过本地临时文件
+    file_key = await asyncio.to_thread(upload_to_oss, audio_data, str(request.user_id))
     if not file_key:
         custom_logger.error("Failed to upload voice file to OSS")
         raise HTTPException(status_code=500, detail="Failed to upload voice file to OSS")
 
     voice_response_url = f"https://pillow.fanwoon.com/{file_key}"
-    custom_logger.info(f"Voice file uploaded successfully: {voice_response_url}")
+    custom_logger.info("Voice file uploaded successfully: {}", voice_response_url)
 
     return Text2VoiceResponse(user_id=int(request.user_id), text_id=int(request.text_id), url=voice_response_url)
 
 
-def upload_to_oss(voice_output_path, user_id):
-    custom_logger.info(f"Uploading voice file to OSS for user: {user_id}")
+def upload_to_oss(audio_data, user_id):
+    custom_logger.info("Uploading voice file to OSS for user: {}", user_id)
     file_key_prefix = "message_chat"
     file_key = file_key_prefix + f"/{uuid.uuid4()}_{user_id}_{time.time()}.mp3"
     bucket = get_oss_bucket()
     try:
-        upload_result = bucket.put_object_from_file(file_key, voice_output_path)
+        upload_result = bucket.put_object(file_key, audio_data)
         if upload_result.status == 200:
             voice_response_url = f"https://pillow-agent.oss-cn-shanghai.aliyuncs.com/{file_key}"
-            custom_logger.info(f"Voice file uploaded successfully: {voice_response_url}")
+            custom_logger.info("Voice file uploaded successfully: {}", voice_response_url)
             return file_key
     except Exception as e:
-        custom_logger.error(f"Error uploading file to OSS: {str(e)}")
+        custom_logger.error("Error uploading file to OSS: {}", e)
     return None
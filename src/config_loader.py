@@ -0,0 +1,33 @@
+import os
+from functools import lru_cache
+from types import MappingProxyType
+import yaml
+
+try:
+    # 优先使用 libyaml 的 C 实现
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# 构建config.yaml的绝对路径
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.yaml")
+
+
+def _freeze(value):
+    # 各层 dict 换成只读视图；列表保持原样，调用方只应读取
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    return value
+
+
+@lru_cache(maxsize=None)
+def _load_yaml(path):
+    # 以二进制方式读取，由 loader 自行解码；同一文件在进程内只解析一次
+    # 解析结果在各模块间共享，以只读视图返回，避免某个调用方的修改影响整个进程
+    with open(path, "rb") as config_file:
+        return _freeze(yaml.load(config_file, Loader=SafeLoader))
+
+
+def load_config(path=CONFIG_PATH):
+    # 统一按绝对路径缓存，显式传入路径与使用默认路径的调用共用同一份解析结果
+    return _load_yaml(os.path.abspath(path))
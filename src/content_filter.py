@@ -1,59 +1,175 @@
-import re
 from typing import List, Tuple
 import difflib
 import os
+import pickle
+import re
+import ahocorasick
+
+# 敏感词表，以及按词表文件 mtime 与大小缓存的敏感词自动机
+SENSITIVE_WORD_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sensitive_word_data_v2.txt")
+SENSITIVE_AUTOMATON_CACHE = SENSITIVE_WORD_FILE + ".ac.pkl"
+# 自动机中值的格式版本，build_automaton 存入的值结构变化时需加一，使旧缓存失效
+SENSITIVE_AUTOMATON_FORMAT = 1
+
+# 重复检测用的句子切分（与 utils.SENTENCE_PATTERN 规则不同）：每段为句子连同其后的句末标点或换行，各段依次拼接即为原文
+REPETITION_SEGMENT_PATTERN = re.compile(r'[^。！？；…!?;\n]*[。！？；…!?;\n]+|[^。！？；…!?;\n]+')
+# 比较句子相似度前去掉的句末标点，只差标点的短句也能判为重复
+SENTENCE_TERMINATORS = '。！？；…!?;'
+
+
 class ContentFilter:
     def __init__(self,additional_keywords: List[str] = None):
-        self.sensitive_words = self.load_sensitive_words()
         self.keywords = additional_keywords or []
-        self.sensitive_pattern = re.compile("|".join(map(re.escape, self.sensitive_words)), re.IGNORECASE)
-        self.keyword_pattern = re.compile("|".join(map(re.escape, self.keywords)), re.IGNORECASE)
+        # 敏感词、关键词检测都走 Aho-Corasick 自动机，一次线性扫描匹配全部词条
+        self.sensitive_automaton = self.load_sensitive_automaton()
+        self.keyword_automaton = self.build_automaton(self.keywords)
 
-    def load_sensitive_words(self) -> List[str]:
-        # 获取当前脚本的目录
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        # 构建config.yaml的绝对路径
-        config_path = os.path.join(current_dir, "sensitive_word_data_v2.txt")
+    @staticmethod
+    def build_automaton(words: List[str]) -> ahocorasick.Automaton:
+        automaton = ahocorasick.Automaton()
+        for order, word in enumerate(words):
+            # 统一小写匹配；小写后重复的词只保留词表中靠前的一个
+            key = word.lower()
+            if not automaton.exists(key):
+                # 值为 (词表顺序, 匹配长度, 原词)
+                automaton.add_word(key, (order, len(key), word))
+        automaton.make_automaton()
+        return automaton
+
+    @staticmethod
+    def match_automaton(automaton: ahocorasick.Automaton, text: str) -> set:
+        # 空词表构建不出自动机，直接视为无匹配
+        if automaton.kind != ahocorasick.AHOCORASICK:
+            return set()
+        return {word for _, (_, _, word) in automaton.iter(text.lower())}
 
-        with open(config_path, 'r', encoding='utf-8') as file:
+    def load_sensitive_words(self) -> List[str]:
+        with open(SENSITIVE_WORD_FILE, 'r', encoding='utf-8') as file:
             return [line.strip() for line in file if line.strip()]
 
+    def load_sensitive_automaton(self) -> ahocorasick.Automaton:
+        # 词表有数万条，构建自动机远慢于反序列化；词表文件未变化时直接加载磁盘缓存
+        stat = os.stat(SENSITIVE_WORD_FILE)
+        cache_key = (SENSITIVE_AUTOMATON_FORMAT, stat.st_mtime_ns, stat.st_size)
+        try:
+            with open(SENSITIVE_AUTOMATON_CACHE, 'rb') as cache_file:
+                cached_key, automaton = pickle.load(cache_file)
+            if cached_key == cache_key and isinstance(automaton, ahocorasick.Automaton):
+                return automaton
+        except Exception:
+            # 缓存损坏、结构不符或由其他版本的 pyahocorasick 写入时都重新构建
+            pass
+
+        automaton = self.build_automaton(self.load_sensitive_words())
+        # 先写临时文件再原子替换，多个 worker 同时启动时不会读到写了一半的缓存；目录不可写时跳过缓存
+        tmp_path = f"{SENSITIVE_AUTOMATON_CACHE}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as cache_file:
+                pickle.dump((cache_key, automaton), cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, SENSITIVE_AUTOMATON_CACHE)
+        except Exception:
+            # 写缓存失败不影响本次使用，只清理残留的临时文件
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        return automaton
+
     def detect_sensitive_content(self, text: str) -> Tuple[bool, List[str]]:
-        matches = self.sensitive_pattern.findall(text)
-        return bool(matches), list(set(matches))
+        matches = self.match_automaton(self.sensitive_automaton, text)
+        return bool(matches), list(matches)
 
     def filter_sensitive_content(self, text: str, replacement: str = "***") -> str:
-        return self.sensitive_pattern.sub(replacement, text)
+        if self.sensitive_automaton.kind != ahocorasick.AHOCORASICK:
+            return text
+        lowered = text.lower()
+        # 个别字符小写后长度会变化，此时逐字符记录小写文本到原文的位置映射
+        positions = None
+        if len(lowered) != len(text):
+            positions = [i for i, char in enumerate(text) for _ in char.lower()] + [len(text)]
+            lowered = ''.join(char.lower() for char in text)
+
+        # 每个起点只保留词表中最靠前的词，与按词表顺序排列的正则分支匹配结果一致
+        spans = {}
+        for end, (order, length, _) in self.sensitive_automaton.iter(lowered):
+            start = end - length + 1
+            if start not in spans or order < spans[start][0]:
+                spans[start] = (order, end + 1)
+
+        # 从左到右替换互不重叠的匹配；cursor 为小写文本中的位置，position 为原文中的位置
+        pieces = []
+        cursor = position = 0
+        for start in sorted(spans):
+            if start < cursor:
+                continue
+            cursor = spans[start][1]
+            if positions is None:
+                text_start, text_end = start, cursor
+            else:
+                text_start, text_end = positions[start], positions[cursor]
+            pieces.append(text[position:text_start])
+            pieces.append(replacement)
+            position = text_end
+        pieces.append(text[position:])
+        return ''.join(pieces)
 
     def check_sentence_similarity(self, sentence1: str, sentence2: str) -> float:
         return difflib.SequenceMatcher(None, sentence1, sentence2).ratio()
 
+    @staticmethod
+    def similarity_above(matcher: difflib.SequenceMatcher, sentence: str, similarity_threshold: float) -> float:
+        # matcher 的 seq2 已预先设置：SequenceMatcher 会缓存对 seq2 的分析，这里只替换 seq1
+        # real_quick_ratio / quick_ratio 是 ratio 的上界且计算代价低，先用它们排除明显不相似的句对
+        # 超过阈值时返回相似度，否则返回 0.0
+        matcher.set_seq1(sentence)
+        if matcher.real_quick_ratio() <= similarity_threshold or matcher.quick_ratio() <= similarity_threshold:
+            return 0.0
+        similarity = matcher.ratio()
+        return similarity if similarity > similarity_threshold else 0.0
+
+    @staticmethod
+    def split_sentences(text: str) -> List[str]:
+        return REPETITION_SEGMENT_PATTERN.findall(text)
+
+    @staticmethod
+    def comparable_sentence(segment: str) -> str:
+        # 分段去掉空白与句末标点后用于相似度比较，拼接时仍使用原分段
+        return segment.strip().rstrip(SENTENCE_TERMINATORS).strip()
+
     def detect_repetition(self, text: str, similarity_threshold: float = 0.7) -> List[Tuple[str, str, float]]:
-        sentences = text.split('。')
+        sentences = [sentence for sentence in map(self.comparable_sentence, self.split_sentences(text)) if sentence]
+        # 每个句子只建一次以它为 seq2 的 matcher
+        matchers = [difflib.SequenceMatcher(None, '', sentence) for sentence in sentences]
         repetitions = []
         for i in range(len(sentences)):
             for j in range(i+1, len(sentences)):
-                similarity = self.check_sentence_similarity(sentences[i], sentences[j])
-                if similarity > similarity_threshold:
+                similarity = self.similarity_above(matchers[j], sentences[i], similarity_threshold)
+                if similarity:
                     repetitions.append((sentences[i], sentences[j], similarity))
         return repetitions
 
     def remove_repetitions(self, text: str, similarity_threshold: float = 0.7) -> str:
-        sentences = text.split('。')
-        unique_sentences = []
-        for sentence in sentences:
-            is_duplicate = False
-            for unique_sentence in unique_sentences:
-                if self.check_sentence_similarity(sentence, unique_sentence) > similarity_threshold:
-                    is_duplicate = True
-                    break
-            if not is_duplicate:
-                unique_sentences.append(sentence)
-        return '。'.join(unique_sentences)
+        # 分段保留各自的句末标点与换行，去重后直接拼接；只有标点或空白的分段原样保留
+        kept_segments = []
+        unique_matchers = []  # 已保留句子各自的 matcher，后续句子与其比较时复用
+        for segment in self.split_sentences(text):
+            sentence = self.comparable_sentence(segment)
+            if sentence:
+                is_duplicate = False
+                for unique_matcher in unique_matchers:
+                    if self.similarity_above(unique_matcher, sentence, similarity_threshold):
+                        is_duplicate = True
+                        break
+                if is_duplicate:
+                    # 重复句子去掉，但保留其后的换行，不把前后段落粘在一起（分段中的换行都在句末标点串里）
+                    kept_segments.append('\n' * segment.count('\n'))
+                    continue
+                unique_matchers.append(difflib.SequenceMatcher(None, '', sentence))
+            kept_segments.append(segment)
+        return ''.join(kept_segments)
 
     def detect_keywords(self, text: str) -> List[str]:
-        matches = self.keyword_pattern.findall(text)
-        return list(set(matches))
+        return list(self.match_automaton(self.keyword_automaton, text))
 
     def process_text(self, text: str) -> dict:
         is_sensitive, sensitive_words = self.detect_sensitive_content(text)
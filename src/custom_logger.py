@@ -5,6 +5,7 @@ import sys
 from pathlib import Path
 from loguru import logger
 import yaml
+from src.config_loader import load_config
 
 
 class InterceptHandler(logging.Handler):
@@ -92,9 +93,8 @@ class CustomizeLogger:
     @classmethod
     def load_logging_config(cls, config_path):
         try:
-            with open(config_path, "r", encoding="utf-8") as config_file:
-                config = yaml.safe_load(config_file)
-                return config
+            # 与其他模块共用 load_config 的缓存，config.yaml 只解析一次
+            return load_config(str(config_path))
         except FileNotFoundError:
             print(f"无法找到配置文件: {config_path}")
             # 可以在这里添加更多的错误处理逻辑
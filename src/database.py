@@ -1,17 +1,11 @@
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 import yaml
-import os
 import urllib
-
-# 获取当前脚本的目录
-current_dir = os.path.dirname(os.path.abspath(__file__))
-# 构建config.yaml的绝对路径
-config_path = os.path.join(current_dir, "config.yaml")
+from src.config_loader import CONFIG_PATH as config_path, load_config
 
 try:
-    with open(config_path, "r", encoding="utf-8") as config_file:
-        config = yaml.safe_load(config_file)
+    config = load_config()
 except FileNotFoundError:
     print(f"无法找到配置文件: {config_path}")
     # 可以在这里添加更多的错误处理逻辑
@@ -23,14 +17,17 @@ except UnicodeDecodeError:
 encoded_password = urllib.parse.quote(config["database"]["password"])
 host = config["database"]["host"]
 username = config["database"]["username"]
-DATABASE_URI = f'mysql+pymysql://{username}:{encoded_password}@{host}/pillow_customer_test'
-engine = create_engine(DATABASE_URI, pool_pre_ping=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+DATABASE_URI = f'mysql+aiomysql://{username}:{encoded_password}@{host}/pillow_customer_test'
+# 连接池大小可在 config.yaml 的 database 段中覆盖
+engine = create_async_engine(
+    DATABASE_URI,
+    pool_size=config["database"].get("pool_size", 20),
+    max_overflow=config["database"].get("max_overflow", 10),
+    pool_recycle=3600,
+    pool_pre_ping=True
+)
+SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
-
@@ -1,13 +1,16 @@
 import logging
-import os
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 from sqlalchemy.exc import OperationalError, DBAPIError
 from typing import List, Dict
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 import yaml
 import urllib
+import asyncio
+from datetime import date, timedelta
 from src.custom_logger import custom_logger  # 导入自定义logger
+from src.config_loader import CONFIG_PATH, load_config as load_app_config
 
 
 class DialogueQuery:
@@ -16,126 +19,142 @@ class DialogueQuery:
             self.db = db
         else:
             self.engine = self.load_config()
-            self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
-            self.db = next(self.get_db())
+            self.SessionLocal = sessionmaker(bind=self.engine, class_=AsyncSession, autoflush=False,
+                                             expire_on_commit=False)
+            self.db = self.SessionLocal()
 
     def load_config(self):
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        config_path = os.path.join(current_dir, "config.yaml")
+        config_path = CONFIG_PATH
 
         try:
-            with open(config_path, "r", encoding="utf-8") as config_file:
-                config = yaml.safe_load(config_file)
-                encoded_password = urllib.parse.quote(config["database"]["password"])
-                host = config["database"]["host"]
-                username = config["database"]["username"]
-                DATABASE_URI = f'mysql+mysqldb://{username}:{encoded_password}@{host}'
-                engine = create_engine(DATABASE_URI,pool_recycle=3600,pool_pre_ping=True)
-                return engine
+            # 复用 load_app_config 的缓存结果，不再单独解析 config.yaml
+            config = load_app_config()
+            encoded_password = urllib.parse.quote(config["database"]["password"])
+            host = config["database"]["host"]
+            username = config["database"]["username"]
+            DATABASE_URI = f'mysql+aiomysql://{username}:{encoded_password}@{host}'
+            engine = create_async_engine(DATABASE_URI, pool_recycle=3600, pool_pre_ping=True)
+            return engine
         except FileNotFoundError:
-            custom_logger.error(f"无法找到配置文件: {config_path}")
+            custom_logger.error("无法找到配置文件: {}", config_path)
             raise
         except yaml.YAMLError as e:
-            custom_logger.error(f"YAML 解析错误: {e}")
+            custom_logger.error("YAML 解析错误: {}", e)
             raise
         except UnicodeDecodeError:
-            custom_logger.error(f"文件编码错误,请确保 {config_path} 使用 UTF-8 编码")
+            custom_logger.error("文件编码错误,请确保 {} 使用 UTF-8 编码", config_path)
             raise
 
-    def get_db(self):
-        db = self.SessionLocal()
-        try:
-            yield db
-        finally:
-            db.close()
-
     @retry(
         stop=stop_after_attempt(3),  # 最大尝试次数
         wait=wait_exponential(multiplier=1, min=4, max=10),  # 指数退避算法等待时间
         retry=retry_if_exception_type((OperationalError, DBAPIError))  # 遇到特定异常时重试
     )
-    def query_with_retry(self, db_session, query_func, *args, **kwargs):
-        return query_func(db_session, *args, **kwargs)
-
-    def perform_query(self, db_session, user_id):
-        result = db_session.execute(
+    async def query_with_retry(self, db_session, query_func, *args, **kwargs):
+        return await query_func(db_session, *args, **kwargs)
+
+    async def perform_query(self, db_session, user_id, limit=3, days=30):
+        # 历史对话与昵称在一次往返中查出，按 kind 列区分结果集
+        # 最近 limit 个 create_time 在数据库侧选出，只传回这几轮对话的原始行，每轮的拼接在 Python 侧完成
+        # （GROUP_CONCAT 受 group_concat_max_len 限制会截断较长的回复）
+        # 截止时间在 Python 侧算好再绑定，create_time 保持裸列比较以走索引
+        since = date.today() - timedelta(days=days)
+        result = await db_session.execute(
             text("""
-                SELECT
-                    t1.message AS user_message,
-                    t1.text AS assistant_response,
-                    t1.create_time
-                FROM
-                    pillow_customer_prod.t_dialogue t1
-                WHERE
-                    t1.account_id = :user_id
-                AND
-                    t1.create_time >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
+                (
+                    SELECT
+                        'history' AS kind,
+                        t1.message AS user_message,
+                        t1.text AS assistant_response,
+                        t1.create_time,
+                        t1.id
+                    FROM
+                        pillow_customer_prod.t_dialogue t1
+                    JOIN (
+                        SELECT
+                            t2.create_time
+                        FROM
+                            pillow_customer_prod.t_dialogue t2
+                        WHERE
+                            t2.account_id = :user_id
+                        AND
+                            t2.create_time >= :since
+                        GROUP BY
+                            t2.create_time
+                        ORDER BY
+                            t2.create_time DESC
+                        LIMIT :limit
+                    ) recent ON recent.create_time = t1.create_time
+                    WHERE
+                        t1.account_id = :user_id
+                )
+                UNION ALL
+                (
+                    SELECT
+                        'nickname' AS kind,
+                        a.name AS user_message,
+                        NULL AS assistant_response,
+                        NULL AS create_time,
+                        NULL AS id
+                    FROM
+                        pillow_customer_prod.t_account a
+                    WHERE
+                        a.id = :user_id
+                )
                 ORDER BY
-                    t1.create_time DESC, t1.id ASC
+                    create_time DESC, id ASC
             """),
-            {"user_id": user_id}  # 使用参数化查询来防止SQL注入
+            {"user_id": user_id, "since": since, "limit": limit}  # 使用参数化查询来防止SQL注入
         )
-        return result.fetchall()
 
-    def nickname_query(self, db_session, user_id):
-        result = db_session.execute(
-            text("""
-                    SELECT a.name 
-                    FROM pillow_customer_prod.t_account a
-                    WHERE a.id = :user_id
-            """),
-            {"user_id": user_id}  # 使用参数化查询来防止SQL注入
-        )
-        row = result.fetchone()
-        custom_logger.info(f"user nickname is {row}")
-        return row[0] if row else '陌生人'  # 如果有结果，则返回第一项，否则返回None
+        turns = []  # [用户消息, 回复片段列表, create_time]，按 create_time 倒序
+        nickname = '陌生人'  # 查不到账号时的默认昵称
+        for kind, user_msg, assistant_msg, create_time, _ in result:
+            if kind == 'nickname':
+                nickname = user_msg
+                continue
+            # 同一轮的多行按 id 升序相邻返回：用户消息取最后一条非空的，回复按顺序以空格拼接
+            if not turns or turns[-1][2] != create_time:
+                turns.append([None, [], create_time])
+            if user_msg:
+                turns[-1][0] = user_msg
+            if assistant_msg:
+                turns[-1][1].append(assistant_msg)
+        history_rows = [(user_msg, " ".join(parts), create_time) for user_msg, parts, create_time in turns]
+        custom_logger.info("user nickname is {}", nickname)
+        return history_rows, nickname
 
-    def get_user_dialogue_history(self, user_id: str):
+    async def get_user_dialogue_history(self, user_id: str):
         try:
-            print("我在这里")
-            results = self.query_with_retry(self.db, self.perform_query, user_id)
-            nickname = self.query_with_retry(self.db, self.nickname_query, user_id)
+            results, nickname = await self.query_with_retry(self.db, self.perform_query, user_id)
         except Exception as e:
             results = []
             nickname = '陌生人'
-            custom_logger.error(f"Failed to execute query after retries: {e}")
+            custom_logger.error("Failed to execute query after retries: {}", e)
         return self._process_query_results(results), nickname
 
     def _process_query_results(self, query_results):
+        # 查询结果已按 create_time 倒序聚合，直接展开为对话消息
         processed_results = []
-        temp_dict = {}
-
-        for query_result in query_results:
-            user_msg = query_result[0]
-            assistant_msg = query_result[1]
-            timestamp = query_result[2]
-
-            if timestamp not in temp_dict:
-                temp_dict[timestamp] = {"user": "", "assistant": ""}
-
+        for user_msg, assistant_msg, _ in query_results:
             if user_msg:
-                temp_dict[timestamp]["user"] = user_msg
+                processed_results.append({"role": "user", "content": user_msg})
             if assistant_msg:
-                if temp_dict[timestamp]["assistant"]:
-                    temp_dict[timestamp]["assistant"] += " " + assistant_msg
-                else:
-                    temp_dict[timestamp]["assistant"] = assistant_msg
-
-        # 按照 timestamp 排序并取最近的 3 条对话
-        sorted_keys = sorted(temp_dict.keys(), reverse=True)
-        for key in sorted_keys[:3]:
-            if temp_dict[key]["user"]:
-                processed_results.append({"role": "user", "content": temp_dict[key]["user"]})
-            if temp_dict[key]["assistant"]:
-                processed_results.append({"role": "assistant", "content": temp_dict[key]["assistant"]})
+                processed_results.append({"role": "assistant", "content": assistant_msg})
 
         return processed_results
 
 
 # 示例用法
 if __name__ == "__main__":
-    dialogue_query = DialogueQuery(if_test=True)
-    result, user_nickname = dialogue_query.get_user_dialogue_history('1000007')
-    # result = dialogue_query.perform_query('1000004')
-    print(result)
-    print("user_nickname", user_nickname)
+    async def main():
+        dialogue_query = DialogueQuery(if_test=True)
+        try:
+            result, user_nickname = await dialogue_query.get_user_dialogue_history('1000007')
+            print(result)
+            print("user_nickname", user_nickname)
+        finally:
+            await dialogue_query.db.close()
+            await dialogue_query.engine.dispose()
+
+    asyncio.run(main())
@@ -2,10 +2,78 @@ from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import uvicorn
-from src.api.routes import router
+from contextlib import asynccontextmanager
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+from src.api.routes import router, http_client, config, model_names, get_content_filter
+from src.database import engine
+from src.oss_client import get_oss_bucket
+from src.custom_logger import custom_logger
+
+# 单项预热的超时时间（秒），避免依赖不可达时拖慢启动
+WARMUP_TIMEOUT = 10
+
+# 默认线程池大小：敏感词检测、语音合成与 OSS 上传都通过 asyncio.to_thread 在其中执行
+THREAD_POOL_SIZE = int(os.getenv("THREAD_POOL_SIZE", "64"))
+
+
+async def warmup_database():
+    # 预先建立数据库连接，放入连接池
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+async def warmup_model_apis():
+    # 预先与各模型服务完成 TCP/TLS 握手，连接保留在 http_client 的连接池中；只关心连接，不关心响应状态码
+    base_urls = {config[model_name]["base_url"] for model_name in model_names}
+    await asyncio.gather(*(http_client.head(base_url, timeout=5.0) for base_url in base_urls))
+
+
+async def warmup_oss():
+    # 创建 Bucket 对象并完成一次请求，oss2 为同步接口，放到线程中执行
+    await asyncio.to_thread(lambda: get_oss_bucket().get_bucket_info())
+
+
+async def warmup_content_filter():
+    # 加载敏感词自动机，避免第一个请求承担构建开销
+    await asyncio.to_thread(get_content_filter)
+
+
+async def warmup():
+    # 各项预热互不依赖，并发执行；失败只记录日志，不影响服务启动
+    steps = {
+        "database": warmup_database(),
+        "model_apis": warmup_model_apis(),
+        "oss": warmup_oss(),
+        "content_filter": warmup_content_filter()
+    }
+    results = await asyncio.gather(
+        *(asyncio.wait_for(step, WARMUP_TIMEOUT) for step in steps.values()),
+        return_exceptions=True
+    )
+    for name, result in zip(steps, results):
+        if isinstance(result, Exception):
+            custom_logger.warning("Warmup of {} failed: {!r}", name, result)
+        else:
+            custom_logger.info("Warmup of {} done", name)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 替换默认线程池，避免并发语音请求受限于默认的 min(32, cpu + 4) 个线程
+    executor = ThreadPoolExecutor(max_workers=THREAD_POOL_SIZE, thread_name_prefix="pillow-worker")
+    asyncio.get_running_loop().set_default_executor(executor)
+    await warmup()
+    yield
+    # 关闭时释放到上游模型服务与数据库的连接池，避免事件循环关闭后连接才被回收
+    await http_client.aclose()
+    await engine.dispose()
+    executor.shutdown(wait=False)
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="Pillow Talk", debug=False)
+    app = FastAPI(title="Pillow Talk", debug=False, lifespan=lifespan)
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
@@ -18,22 +86,17 @@ def create_app() -> FastAPI:
 app = create_app()
 app.include_router(router)
 
-async def set_body(request: Request):
-    receive_ = await request._receive()
-    async def receive():
-        return receive_
-    request._receive = receive
-
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: Exception):
-    await set_body(request)
-    request_text = await request.body(2)
-    request_text = str(request_text.decode('utf-8'))
-    app.logger.warning(f'请求发生异常，记录request的请求体如下:{request_text}')
+    # 路由解析请求体时已缓存在 request 上，这里直接读取
+    request_text = await request.body()
+    request_text = request_text.decode('utf-8', errors='replace')
+    custom_logger.warning('请求发生异常，记录request的请求体如下:{}', request_text)
     return JSONResponse(
         status_code=exc.status_code if isinstance(exc, HTTPException) else 500,
         content={"detail": exc.detail}
     )
 
 if __name__ == '__main__':
-    uvicorn.run(app, host="0.0.0.0", port=8000 )
\ No newline at end of file
+    # 事件循环与 HTTP 解析器由 uvicorn 自动选择，安装了 uvloop、httptools 时优先使用
+    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -1,15 +1,13 @@
-from pathlib import Path
-import os
-import yaml
 import oss2
-from src.custom_logger import *
+from functools import lru_cache
+from src.custom_logger import custom_logger
+from src.config_loader import load_config
 
+@lru_cache(maxsize=1)
 def get_oss_bucket():
+    # Bucket 对象无请求级状态，进程内只创建一次并复用
+    config = load_config()
 
-    config_path = os.path.join(os.path.dirname(__file__), "config.yaml")
-    with open(config_path, "r", encoding="utf-8") as config_file:
-        config = yaml.safe_load(config_file)
-    
     # 从config中获取OSS配置
     oss_config = config['oss_key']
     
@@ -24,7 +22,7 @@ def get_oss_bucket():
     # 创建Bucket对象
     bucket = oss2.Bucket(auth, endpoint, bucket_name)
     
-    custom_logger.info(f"OSS bucket '{bucket_name}' created successfully")
+    custom_logger.info("OSS bucket '{}' created successfully", bucket_name)
     
     return bucket
 
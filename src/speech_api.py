@@ -39,27 +39,26 @@ class SpeechAPI:
         }
         return request_body
 
-    def send_request(self, api_url, request_body, output_path):
+    def send_request(self, api_url, request_body):
+        """请求语音合成接口，成功时返回 MP3 音频字节，失败返回 None"""
         headers = {
             "Authorization": f"Bearer;{self.config['access_token']}"
         }
         try:
-            (f"Sending request to {api_url} with headers {headers} and body {request_body}")
             response = requests.post(api_url, json=request_body, headers=headers)
-            custom_logger.info(f"HTTP status code: {response.status_code}")
+            custom_logger.info("HTTP status code: {}", response.status_code)
             if response.status_code == 200:
                 response_json = response.json()
                 if "data" in response_json:
-                    data = response_json["data"]
-                    with open(output_path, "wb") as file_to_save:  # 保存为 MP3 文件
-                        file_to_save.write(base64.b64decode(data))
-                    custom_logger.info("MP3 文件已保存为 output.mp3")
+                    # 直接返回解码后的音频，不落盘
+                    return base64.b64decode(response_json["data"])
                 else:
                     custom_logger.error("响应中没有找到数据")
             else:
-                custom_logger.error(f"HTTP 请求失败: {response.status_code}")
+                custom_logger.error("HTTP 请求失败: {}", response.status_code)
         except Exception as e:
-            custom_logger.error(f"An error occurred: {e}")
+            custom_logger.error("An error occurred: {}", e)
+        return None
 
 
 if __name__ == "__main__":
@@ -67,4 +66,7 @@ if __name__ == "__main__":
     text = "请输入要合成的文本"
     request_body = speech_api.generate_request_body(text)
     api_url = "https://openspeech.bytedance.com/api/v1/tts"
-    speech_api.send_request(api_url, request_body)
+    audio_data = speech_api.send_request(api_url, request_body)
+    if audio_data:
+        with open("output.mp3", "wb") as file_to_save:  # 保存为 MP3 文件
+            file_to_save.write(audio_data)
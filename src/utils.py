@@ -3,66 +3,76 @@ import re
 import random
 from collections import Counter
 
+# 情绪关键词、情绪编号与表情符号映射，模块加载时构建一次
+EMOTION_KEYWORDS = {
+    '开心': ['哈哈', '开心', '高兴', '快乐', '棒', '好', '有趣', '愉快', '甜', '喜欢', '爱', '欢乐', '兴奋', '赞', '爽', '满意', 
+             '开怀', '乐', '笑', '幸福', '舒心', '轻松', '愉悦', '欣喜', '欢欣', '喜悦', '欢快', '畅快', '美好', '温馨'],
+    '期待': ['期待', '希望', '盼望', '等待', '想要', '充满', '未来', '憧憬', '向往', '渴望', '梦想', '展望', '憧憬', '聊聊', '来说说', '怎么样',
+             '期盼', '企盼', '盼', '期许', '憧憬', '展望', '畅想', '憧憬', '向往', '渴求', '期望', '期冀', '期盼', '期许'],
+    '生气': ['生气', '操','愤怒', '讨厌', '烦', '恨', '不想', '恼火', '气愤', '不爽', '不满', '不快', '恼怒', '厌恶', '烦躁', '不理', '不搭理',
+             '恼', '怒', '火大', '气死', '气炸', '恨死', '烦死', '厌烦', '讨厌', '憎恨', '恼怒', '气愤', '恼火', '气恼'],
+    '伤心': ['伤心', '难过', '悲伤', '哭', '痛苦', '忧伤', '失落', '沮丧', '遗憾', '惆怅', '悲观', '消沉', '绝望',
+             '心碎', '悲痛', '哀伤', '悲凄', '凄凉', '凄惨', '悲惨', '凄凉', '悲戚', '悲怆', '悲恸', '悲恻', '悲凉'],
+    '惊恐': ['害怕', '恐惧', '惊吓', '可怕', '吓', '惊慌', '担心', '焦虑', '恐慌', '惶恐', '惊骇', '惊惶', '怕怕', '呜呜',
+             '惊', '骇', '惧', '惶', '惊悚', '惊惧', '惊恐', '惊骇', '惊惶', '惊惧', '惊怖', '惊慌', '惊吓', '惊惧'],
+    '害羞': ['害羞', '尴尬', '羞涩', '脸红', '不好意思', '腼腆', '羞怯', '难为情', '扭捏', '拘谨',
+             '羞赧', '羞怯', '羞涩', '羞答答', '羞怯怯', '羞答答', '羞赧赧', '羞涩涩', '羞怯怯', '羞答答'],
+    '抱抱': ['抱抱', '拥抱', '安慰', '需要', '温暖', '安慰', '呵护', '依偎', '亲密', '体贴', '关爱',
+             '搂', '抱', '拥', '抱紧', '搂紧', '依偎', '依靠', '依附', '依恋', '依赖'],
+    '无语': ['无语', '哎，', '不知道说什么', '呵呵', '无话可说', '不知所措', '茫然', '不明白', '困惑', '莫名其妙',
+             '懵', '懵逼', '懵圈', '蒙圈', '蒙蔽', '迷糊', '迷茫', '迷惑', '迷惘', '迷失']
+}
+
+EMOTION_MAP = {
+    "开心": 2,
+    "期待": 6,
+    "生气": 7,
+    "伤心": 8,
+    "惊恐": 5,
+    "害羞": 1,
+    "抱抱": 3,
+    "无语": 4
+}
+
+# 表情符号映射
+EMOJI_MAP = {
+    '😊': '开心', '😄': '开心', '😃': '开心', '😁': '开心',
+    '🤔': '期待', '🙏': '期待',
+    '😠': '生气', '😡': '生气', '🤬': '生气',
+    '😢': '伤心', '😭': '伤心', '😞': '伤心',
+    '😨': '惊恐', '😱': '惊恐', '😰': '惊恐',
+    '😳': '害羞', '🤭': '害羞',
+    '🤗': '抱抱',
+    '😐': '无语', '😑': '无语', '🙄': '无语'
+}
+
+# 扁平化的 (关键词, 情绪, 权重) 列表；关键词在同一情绪中重复出现时累加权重，与逐个遍历列表的计分结果一致
+EMOTION_KEYWORD_WEIGHTS = tuple(
+    (keyword, emotion, 2 * occurrences)  # 关键词匹配权重加倍
+    for emotion, keywords in EMOTION_KEYWORDS.items()
+    for keyword, occurrences in Counter(keywords).items()
+)
+
+# 预编译的正则
+SYMBOLS_TO_REMOVE_PATTERN = re.compile(r'[\\"\(\)\[\]\{\}]')
+LEADING_SYMBOLS_PATTERN = re.compile(r'^[^\w\s]+')
+SENTENCE_PATTERN = re.compile(r'([^。！？\s]+[。！？]?)|([^。！？\s]+\s)')
+
+
 def get_emotion_type(text: str) -> int:
-    emotion_keywords = {
-        '开心': ['哈哈', '开心', '高兴', '快乐', '棒', '好', '有趣', '愉快', '甜', '喜欢', '爱', '欢乐', '兴奋', '赞', '爽', '满意', 
-                 '开怀', '乐', '笑', '幸福', '舒心', '轻松', '愉悦', '欣喜', '欢欣', '喜悦', '欢快', '畅快', '美好', '温馨'],
-        '期待': ['期待', '希望', '盼望', '等待', '想要', '充满', '未来', '憧憬', '向往', '渴望', '梦想', '展望', '憧憬', '聊聊', '来说说', '怎么样',
-                 '期盼', '企盼', '盼', '期许', '憧憬', '展望', '畅想', '憧憬', '向往', '渴求', '期望', '期冀', '期盼', '期许'],
-        '生气': ['生气', '操','愤怒', '讨厌', '烦', '恨', '不想', '恼火', '气愤', '不爽', '不满', '不快', '恼怒', '厌恶', '烦躁', '不理', '不搭理',
-                 '恼', '怒', '火大', '气死', '气炸', '恨死', '烦死', '厌烦', '讨厌', '憎恨', '恼怒', '气愤', '恼火', '气恼'],
-        '伤心': ['伤心', '难过', '悲伤', '哭', '痛苦', '忧伤', '失落', '沮丧', '遗憾', '惆怅', '悲观', '消沉', '绝望',
-                 '心碎', '悲痛', '哀伤', '悲凄', '凄凉', '凄惨', '悲惨', '凄凉', '悲戚', '悲怆', '悲恸', '悲恻', '悲凉'],
-        '惊恐': ['害怕', '恐惧', '惊吓', '可怕', '吓', '惊慌', '担心', '焦虑', '恐慌', '惶恐', '惊骇', '惊惶', '怕怕', '呜呜',
-                 '惊', '骇', '惧', '惶', '惊悚', '惊惧', '惊恐', '惊骇', '惊惶', '惊惧', '惊怖', '惊慌', '惊吓', '惊惧'],
-        '害羞': ['害羞', '尴尬', '羞涩', '脸红', '不好意思', '腼腆', '羞怯', '难为情', '扭捏', '拘谨',
-                 '羞赧', '羞怯', '羞涩', '羞答答', '羞怯怯', '羞答答', '羞赧赧', '羞涩涩', '羞怯怯', '羞答答'],
-        '抱抱': ['抱抱', '拥抱', '安慰', '需要', '温暖', '安慰', '呵护', '依偎', '亲密', '体贴', '关爱',
-                 '搂', '抱', '拥', '抱紧', '搂紧', '依偎', '依靠', '依附', '依恋', '依赖'],
-        '无语': ['无语', '哎，', '不知道说什么', '呵呵', '无话可说', '不知所措', '茫然', '不明白', '困惑', '莫名其妙',
-                 '懵', '懵逼', '懵圈', '蒙圈', '蒙蔽', '迷糊', '迷茫', '迷惑', '迷惘', '迷失']
-    }
-    
-    emotion_map = {
-        "开心": 2,
-        "期待": 6,
-        "生气": 7,
-        "伤心": 8,
-        "惊恐": 5,
-        "害羞": 1,
-        "抱抱": 3,
-        "无语": 4
-    }
-    
-    # 表情符号映射
-    emoji_map = {
-        '😊': '开心', '😄': '开心', '😃': '开心', '😁': '开心',
-        '🤔': '期待', '🙏': '期待',
-        '😠': '生气', '😡': '生气', '🤬': '生气',
-        '😢': '伤心', '😭': '伤心', '😞': '伤心',
-        '😨': '惊恐', '😱': '惊恐', '😰': '惊恐',
-        '😳': '害羞', '🤭': '害羞',
-        '🤗': '抱抱',
-        '😐': '无语', '😑': '无语', '🙄': '无语'
-    }
-    
     text = text.lower()
     exclamation_count = text.count('!')
     question_count = text.count('?')
     
-    # 词频分析
-    word_counts = Counter(re.findall(r'\w+', text))
-    
-    emotion_scores = {emotion: 0 for emotion in emotion_keywords.keys()}
-    
+    emotion_scores = dict.fromkeys(EMOTION_KEYWORDS, 0)
+
     # 关键词匹配
-    for emotion, keywords in emotion_keywords.items():
-        for keyword in keywords:
-            if keyword in text:
-                emotion_scores[emotion] += text.count(keyword) * 2  # 关键词匹配权重加倍
-    
+    for keyword, emotion, weight in EMOTION_KEYWORD_WEIGHTS:
+        if keyword in text:
+            emotion_scores[emotion] += text.count(keyword) * weight
+
     # 表情符号判断
-    for emoji, emotion in emoji_map.items():
+    for emoji, emotion in EMOJI_MAP.items():
         if emoji in text:
             emotion_scores[emotion] += text.count(emoji) * 3  # 表情符号权重更高
     
@@ -78,9 +88,9 @@ def get_emotion_type(text: str) -> int:
     
     # 如果最高分为0，则返回'无语'
     if emotion_scores[max_emotion] == 0:
-        return emotion_map['无语']
+        return EMOTION_MAP['无语']
     
-    return emotion_map[max_emotion]
+    return EMOTION_MAP[max_emotion]
 
 def generate_random_proportions(count: int) -> List[float]:
     """生成count个随机比例，总和为1"""
@@ -90,15 +100,13 @@ def generate_random_proportions(count: int) -> List[float]:
 
 
 def clean_sentence(sentence: str) -> str:
-    # 定义要移除的符号
-    symbols_to_remove = r'[\\"\(\)\[\]\{\}]'
-    # 使用正则表达式替换这些符号为空字符串
-    cleaned_sentence = re.sub(symbols_to_remove, '', sentence)
+    # 使用预编译的正则将要移除的符号替换为空字符串
+    cleaned_sentence = SYMBOLS_TO_REMOVE_PATTERN.sub('', sentence)
     # 去除首尾空白字符
     cleaned_sentence = cleaned_sentence.strip()
     
     # 去除句子开头到第一个文字之间的所有符号
-    cleaned_sentence = re.sub(r'^[^\w\s]+', '', cleaned_sentence)
+    cleaned_sentence = LEADING_SYMBOLS_PATTERN.sub('', cleaned_sentence)
     
     return cleaned_sentence
 
@@ -113,8 +121,7 @@ def split_message(message: str, count: int) -> List[str]:
     proportions = generate_random_proportions(count)
 
     # 使用正则表达式匹配句子，考虑空格、句号、感叹号和问号作为分隔符
-    pattern = re.compile(r'([^。！？\s]+[。！？]?)|([^。！？\s]+\s)')
-    sentences = pattern.findall(message)
+    sentences = SENTENCE_PATTERN.findall(message)
     sentences = [''.join(s).strip() for s in sentences if ''.join(s).strip()]
 
     result = []
@@ -3,7 +3,9 @@ import requests
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
 import os
-import json
+import orjson
+from array import array
+from functools import lru_cache
 
 class VectorQuery:
     def __init__(self, url: str, api_key: str, collection_name: str, embedding_api_key: str):
@@ -11,6 +13,9 @@ class VectorQuery:
         self.collection_name = collection_name
         self.embedding_api_key = embedding_api_key
         self.embedding_url = "https://api.siliconflow.cn/v1/embeddings"
+        # 按文本缓存向量，重复的短句（问候、表情等）不再请求 embedding 接口
+        # 向量以 array('f') 紧凑存储（1024 维约 4KB），容量只覆盖高频短句
+        self._cached_embedding = lru_cache(maxsize=512)(self._request_compact_embedding)
 
     def create_collection(self, vector_size: int):
         """创建或重新创建集合"""
@@ -41,7 +46,14 @@ class VectorQuery:
         )
 
     def text_to_vector(self, text: str) -> List[float]:
-        """使用API将文本转换为向量"""
+        """使用API将文本转换为向量，相同文本（去除首尾空白后）命中缓存"""
+        return self._cached_embedding(text.strip()).tolist()
+
+    def _request_compact_embedding(self, text: str) -> array:
+        # 缓存中存放 array，调用方拿到的是 tolist() 的副本，无法修改缓存中的向量
+        return array('f', self._request_embedding(text))
+
+    def _request_embedding(self, text: str) -> List[float]:
         payload = {
             "model": "BAAI/bge-large-zh-v1.5",
             "input": text,
@@ -60,7 +72,8 @@ class VectorQuery:
 
     def insert_text(self, text: str, payload: Dict):
         """将文本转换为向量并插入到向量数据库"""
-        vector = self.text_to_vector(text)
+        # 导入的文档向量不会再被查询命中，绕过缓存并按原文计算
+        vector = self._request_embedding(text)
         doc_id = str(hash(text))  # 使用文本的哈希值作为ID
         payload['text'] = text  # 将原始文本添加到payload中
         self.insert_document(doc_id, vector, payload)
@@ -103,8 +116,9 @@ if __name__ == "__main__":
 
     for filename in os.listdir(doc_path):
         if filename.endswith(".json"):
-            with open(os.path.join(doc_path, filename), 'r', encoding='utf-8') as file:
-                data = json.load(file)
+            # 以二进制读取交给 orjson 解析，省去单独的解码步骤
+            with open(os.path.join(doc_path, filename), 'rb') as file:
+                data = orjson.loads(file.read())
                 for item in data:
                     text = item['text']
                     payload = {